@@ -32,6 +32,10 @@ async def global_exception_handler(request, exc):
 gemini_service = GeminiService()
 pdf_service = PDFService()
 
+@app.on_event("shutdown")
+async def shutdown():
+    pdf_service.shutdown()
+
 @app.get("/")
 async def root():
     return {"message": "Construction Drawing Processor API"}
@@ -79,15 +83,23 @@ async def upload_plans(
     visual_examples: str = Form(None) # Expecting JSON string of visual examples
 ):
     content = await file.read()
-    images = await pdf_service.convert_pdf_to_images(content)
+    document = await pdf_service.open_document(content)
+    
+    if not document or document.page_count == 0:
+        raise HTTPException(status_code=400, detail="Could not convert PDF to images")
     
-    if not images:
+    # Render low-DPI page overviews for display, tile layout and blank detection.
+    # Full-resolution tiles are rendered from the PDF only where needed.
+    try:
+        images = await document.render_pages(dpi=pdf_service.OVERVIEW_DPI)
+    except Exception as e:
+        print(f"Error rendering PDF pages: {e}")
         raise HTTPException(status_code=400, detail="Could not convert PDF to images")
     
     # Extract text from plans for context
     plan_text = await pdf_service.extract_text_from_pdf(content)
     
-    # Process images with Gemini
+    # Process page overviews with Gemini
     # Note: The original code limited to 5 pages for processed_images,
     # but the requested change processes all images.
     processed_images = images
@@ -105,7 +117,8 @@ async def upload_plans(
         equipment, 
         schedule_text=schedule_text, 
         plan_text=plan_text,
-        visual_examples=examples_data # Pass examples_data
+        visual_examples=examples_data, # Pass examples_data
+        pdf_document=document
     )
     
     # Convert images to base64 for frontend display
@@ -126,13 +139,17 @@ async def upload_plans(
 @app.post("/upload/cover-page")
 async def upload_cover_page(file: UploadFile = File(...)):
     content = await file.read()
-    images = await pdf_service.convert_pdf_to_images(content)
+    document = await pdf_service.open_document(content)
     
-    if not images:
+    if not document or document.page_count == 0:
         raise HTTPException(status_code=400, detail="Could not convert PDF to images")
     
     # Process only the first page (cover page)
-    cover_page = images[0]
+    try:
+        cover_page = await document.render(1, dpi=pdf_service.OVERVIEW_DPI)
+    except Exception as e:
+        print(f"Error rendering cover page: {e}")
+        raise HTTPException(status_code=400, detail="Could not convert PDF to images")
     
     # Skip auto-extraction to speed up upload
     # symbols_json = await gemini_service.extract_grd_symbols(cover_page)
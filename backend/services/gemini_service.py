@@ -5,6 +5,7 @@ import time
 import asyncio
 from functools import wraps
 from google.api_core import exceptions
+from services.pdf_service import PDFService
 
 load_dotenv()
 
@@ -82,7 +83,7 @@ class GeminiService:
 
     @retry_with_backoff(retries=5, initial_delay=2)
     @retry_with_backoff(retries=5, initial_delay=2)
-    async def find_equipment_locations(self, plan_images, equipment_list, schedule_text=None, plan_text=None, visual_examples=None):
+    async def find_equipment_locations(self, plan_images, equipment_list, schedule_text=None, plan_text=None, visual_examples=None, pdf_document=None):
         # If single image, convert to list
         if not isinstance(plan_images, list):
             plan_images = [plan_images]
@@ -93,7 +94,12 @@ class GeminiService:
         
         for page_idx, image in enumerate(plan_images):
             # Check image size - if large, use tiling
-            width, height = image.size
+            # With a source document, plan_images are low-DPI overviews and
+            # the size that matters is the page at full tile resolution
+            if pdf_document:
+                width, height = pdf_document.page_size(page_idx + 1, PDFService.TILE_DPI)
+            else:
+                width, height = image.size
             # Threshold for tiling: e.g., > 2000x2000 pixels
             if width > 2000 or height > 2000:
                 print(f"Image size {width}x{height} exceeds threshold. Using tiling strategy.")
@@ -103,9 +109,16 @@ class GeminiService:
                     page_idx + 1,
                     schedule_text,
                     plan_text,
-                    visual_examples
+                    visual_examples,
+                    pdf_document
                 )
             else:
+                if pdf_document:
+                    try:
+                        image = await pdf_document.render(page_idx + 1, dpi=PDFService.TILE_DPI)
+                    except Exception as e:
+                        print(f"Error rendering page {page_idx + 1}: {e}")
+                        continue
                 # Standard processing for smaller images
                 page_locations = await self._process_single_image(
                     image, 
@@ -156,8 +169,16 @@ class GeminiService:
             print(f"Error processing page {page_num}: {e}")
             return []
 
-    async def process_with_tiling(self, image, equipment_list, page_num, schedule_text, plan_text, visual_examples):
-        width, height = image.size
+    async def process_with_tiling(self, image, equipment_list, page_num, schedule_text, plan_text, visual_examples, pdf_document=None):
+        # With a source document, image is a low-DPI overview: tiles are laid out
+        # in full-resolution pixels, blank ones are skipped using the overview,
+        # and only the remaining tiles are rendered from the PDF at TILE_DPI
+        if pdf_document:
+            width, height = pdf_document.page_size(page_num, PDFService.TILE_DPI)
+            scale_x = image.size[0] / width
+            scale_y = image.size[1] / height
+        else:
+            width, height = image.size
         
         # Define tile size and overlap
         TILE_SIZE = 1500 # Process 1500x1500px tiles
@@ -171,6 +192,7 @@ class GeminiService:
         
         print(f"Splitting image into {rows}x{cols} grid")
         
+        skipped = 0
         for r in range(rows):
             for c in range(cols):
                 # Calculate coordinates
@@ -190,14 +212,30 @@ class GeminiService:
                 right = min(width, left + TILE_SIZE)
                 bottom = min(height, top + TILE_SIZE)
                 
-                tile_img = image.crop((left, top, right, bottom))
+                if pdf_document:
+                    overview_tile = image.crop((left * scale_x, top * scale_y, right * scale_x, bottom * scale_y))
+                    if self._is_blank(overview_tile):
+                        skipped += 1
+                        continue
+                    tile_img = None
+                else:
+                    tile_img = image.crop((left, top, right, bottom))
                 tiles.append({
                     'image': tile_img,
+                    'region': [
+                        top / height * 1000,
+                        left / width * 1000,
+                        bottom / height * 1000,
+                        right / width * 1000
+                    ],
                     'offset': (left, top),
                     'size': (right - left, bottom - top),
                     'index': len(tiles)
                 })
 
+        if skipped:
+            print(f"Skipping {skipped} blank tiles")
+
         all_tile_locations = []
         
         # Semaphore to control concurrency (max 10 requests at a time)
@@ -206,6 +244,12 @@ class GeminiService:
         async def process_tile_wrapper(tile):
             async with semaphore:
                 print(f"Processing tile {tile['index']+1}/{len(tiles)}")
+                if tile['image'] is None:
+                    try:
+                        tile['image'] = await pdf_document.render(page_num, tile['region'], PDFService.TILE_DPI)
+                    except Exception as e:
+                        print(f"Error rendering tile {tile['index']}: {e}")
+                        return []
                 return await self._process_single_tile(tile, equipment_list, page_num, visual_examples, width, height)
 
         # Create tasks for all tiles
@@ -284,6 +328,11 @@ class GeminiService:
             
         return tile_locations
 
+    def _is_blank(self, image):
+        # Treat a region as blank if it has no pixel darker than near-white
+        darkest, _ = image.convert('L').getextrema()
+        return darkest >= 245
+
     def _calculate_iou(self, box1, box2):
         # box: [ymin, xmin, ymax, xmax] (0-1000 scale)
         
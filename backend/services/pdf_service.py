@@ -1,10 +1,128 @@
 from pypdf import PdfReader
 from pdf2image import convert_from_bytes
+from PIL import Image
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import functools
+import hashlib
 import io
+import math
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+
+def _render_in_worker(path, page_num, dpi, crop):
+    # Runs in a worker process. page_num is 1-indexed.
+    # crop: (x, y, width, height) in pixels of the page rendered at dpi, or None
+    # for the full page. Poppler rasterizes only the cropped slice.
+    args = ["pdftoppm", "-r", str(dpi), "-f", str(page_num), "-l", str(page_num)]
+    if crop is not None:
+        x, y, width, height = crop
+        args += ["-x", str(x), "-y", str(y), "-W", str(width), "-H", str(height)]
+    args.append(path)
+
+    # Without an output root pdftoppm writes the PPM image to stdout
+    result = subprocess.run(args, capture_output=True)
+    if result.returncode != 0 or not result.stdout:
+        raise RuntimeError(f"pdftoppm failed on page {page_num}: {result.stderr.decode(errors='replace').strip()}")
+
+    image = Image.open(io.BytesIO(result.stdout))
+    image.load()
+    return image
+
+
+def _parse_page_sizes(pdfinfo_output):
+    # Parse "Page N MediaBox" and "Page N rot" lines of `pdfinfo -box`
+    # into (width, height) in points of each page as displayed
+    boxes = {}
+    rotations = {}
+    for line in pdfinfo_output.splitlines():
+        match = re.match(r"Page\s+(\d+)\s+MediaBox:\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)", line)
+        if match:
+            x0, y0, x1, y1 = [float(v) for v in match.groups()[1:]]
+            boxes[int(match.group(1))] = (abs(x1 - x0), abs(y1 - y0))
+            continue
+        match = re.match(r"Page\s+(\d+)\s+rot:\s+(-?\d+)", line)
+        if match:
+            rotations[int(match.group(1))] = int(match.group(2))
+
+    page_sizes = []
+    for page_num in sorted(boxes):
+        width, height = boxes[page_num]
+        if rotations.get(page_num, 0) % 180 == 90:
+            width, height = height, width
+        page_sizes.append((width, height))
+    return page_sizes
+
+
+class PDFDocument:
+    """Handle to a PDF registered with PDFService, used to render pages and regions on demand."""
+
+    def __init__(self, service, doc_hash, page_sizes):
+        self.service = service
+        self.hash = doc_hash
+        # (width, height) in points of each page as displayed
+        self.page_sizes = page_sizes
+
+    @property
+    def page_count(self):
+        return len(self.page_sizes)
+
+    def page_size(self, page_num, dpi):
+        # Pixel size of a full page rendered at the given DPI (rounded up, as pdftoppm does)
+        width, height = self.page_sizes[page_num - 1]
+        return math.ceil(width * dpi / 72), math.ceil(height * dpi / 72)
+
+    def region_to_pixels(self, page_num, region, dpi):
+        # region: [ymin, xmin, ymax, xmax] (0-1000 scale) of the page as displayed
+        # Returns the (x, y, width, height) crop in pixels of the page rendered at dpi
+        page_width, page_height = self.page_size(page_num, dpi)
+        ymin, xmin, ymax, xmax = region
+
+        left = min(page_width - 1, max(0, round(xmin / 1000 * page_width)))
+        top = min(page_height - 1, max(0, round(ymin / 1000 * page_height)))
+        right = min(page_width, round(xmax / 1000 * page_width))
+        bottom = min(page_height, round(ymax / 1000 * page_height))
+
+        return left, top, max(1, right - left), max(1, bottom - top)
+
+    async def render(self, page_num, region=None, dpi=None):
+        # region: [ymin, xmin, ymax, xmax] (0-1000 scale), or None for the full page
+        return await self.service.render_region(self, page_num, region, dpi or self.service.TILE_DPI)
+
+    async def render_pages(self, dpi=None, max_pages=None):
+        count = self.page_count if max_pages is None else min(self.page_count, max_pages)
+        return await asyncio.gather(*[self.render(page_num, dpi=dpi) for page_num in range(1, count + 1)])
+
 
 class PDFService:
-    def __init__(self):
-        pass
+    # Low resolution used for page overviews (display, tile layout and blank detection)
+    OVERVIEW_DPI = 150
+
+    # Resolution at which plan tiles are rendered for detection
+    TILE_DPI = 300
+
+    # Upper bounds for cached renders (decoded pixels) and documents kept on disk
+    CACHE_MAX_BYTES = 512 * 1024 * 1024
+    MAX_DOCUMENTS = 16
+
+    def __init__(self, max_workers=None, executor=None):
+        self.max_workers = max_workers
+        self._executor = executor
+        self._temp_dir = tempfile.mkdtemp(prefix="takeoffs_pdf_")
+        self._documents = OrderedDict()
+        self._render_cache = OrderedDict()
+        self._render_sizes = {}
+        self._render_cache_bytes = 0
+        # In-flight renders per document, and evicted documents whose file
+        # is removed once those renders finish
+        self._pending_renders = {}
+        self._evicted_documents = set()
 
     async def extract_text_from_pdf(self, file_content: bytes) -> str:
         try:
@@ -24,3 +142,144 @@ class PDFService:
         except Exception as e:
             print(f"Error converting PDF to images: {e}")
             return []
+
+    async def open_document(self, file_content: bytes):
+        doc_hash = hashlib.sha256(file_content).hexdigest()
+
+        if doc_hash in self._documents:
+            self._documents.move_to_end(doc_hash)
+            return self._documents[doc_hash]
+
+        path = self._document_path(doc_hash)
+        self._evicted_documents.discard(doc_hash)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(file_content)
+        os.replace(temp_path, path)
+
+        # Read page sizes with poppler, which also does the rendering, so any
+        # file it can rasterize can be opened
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "pdfinfo", "-box", "-f", "1", "-l", "1000000", path,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            stdout, stderr = await process.communicate()
+            if process.returncode != 0:
+                raise RuntimeError(stderr.decode(errors="replace").strip())
+            page_sizes = _parse_page_sizes(stdout.decode(errors="replace"))
+        except Exception as e:
+            print(f"Error opening PDF: {e}")
+            self._remove_document_file(doc_hash)
+            return None
+
+        document = PDFDocument(self, doc_hash, page_sizes)
+        self._documents[doc_hash] = document
+
+        while len(self._documents) > self.MAX_DOCUMENTS:
+            old_hash, _ = self._documents.popitem(last=False)
+            self._evict_document(old_hash)
+
+        return document
+
+    async def render_region(self, document, page_num, region=None, dpi=None):
+        dpi = dpi or self.TILE_DPI
+        if region is not None:
+            region = tuple(round(v, 3) for v in region)
+        key = (document.hash, page_num, region, dpi)
+
+        cached = self._render_cache.get(key)
+        if cached is not None:
+            self._render_cache.move_to_end(key)
+            # Concurrent requests for the same render share one pending future
+            return await asyncio.shield(cached)
+
+        crop = document.region_to_pixels(page_num, region, dpi) if region is not None else None
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._get_executor(),
+            _render_in_worker,
+            self._document_path(document.hash),
+            page_num,
+            dpi,
+            crop,
+        )
+        self._render_cache[key] = future
+        self._pending_renders[document.hash] = self._pending_renders.get(document.hash, 0) + 1
+        # Bookkeeping runs on completion so it doesn't depend on any awaiter surviving
+        future.add_done_callback(functools.partial(self._on_render_done, key))
+
+        return await asyncio.shield(future)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        # Remove the on-disk copies of uploaded documents
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+        self._documents.clear()
+
+    def _get_executor(self):
+        if self._executor is None:
+            # Spawn workers instead of forking the multi-threaded server process
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _document_path(self, doc_hash):
+        return os.path.join(self._temp_dir, f"{doc_hash}.pdf")
+
+    def _evict_document(self, doc_hash):
+        for key in [k for k in self._render_cache if k[0] == doc_hash]:
+            self._drop_cache_entry(key)
+        # Workers may still be reading the file
+        if self._pending_renders.get(doc_hash):
+            self._evicted_documents.add(doc_hash)
+        else:
+            self._remove_document_file(doc_hash)
+
+    def _remove_document_file(self, doc_hash):
+        try:
+            os.remove(self._document_path(doc_hash))
+        except OSError:
+            pass
+
+    def _on_render_done(self, key, future):
+        doc_hash = key[0]
+        self._pending_renders[doc_hash] -= 1
+        if not self._pending_renders[doc_hash]:
+            del self._pending_renders[doc_hash]
+            if doc_hash in self._evicted_documents:
+                self._evicted_documents.discard(doc_hash)
+                self._remove_document_file(doc_hash)
+
+        # Entry may already have been evicted while rendering
+        if self._render_cache.get(key) is not future:
+            return
+        if future.cancelled() or future.exception() is not None:
+            self._render_cache.pop(key)
+            return
+        self._render_sizes[key] = self._image_bytes(future.result())
+        self._render_cache_bytes += self._render_sizes[key]
+        self._trim_render_cache()
+
+    def _trim_render_cache(self):
+        for key in list(self._render_cache):
+            if self._render_cache_bytes <= self.CACHE_MAX_BYTES:
+                break
+            # Never evict renders that are still in flight
+            if key in self._render_sizes:
+                self._drop_cache_entry(key)
+
+    def _drop_cache_entry(self, key):
+        self._render_cache.pop(key)
+        self._render_cache_bytes -= self._render_sizes.pop(key, 0)
+
+    @staticmethod
+    def _image_bytes(image):
+        width, height = image.size
+        return width * height * len(image.getbands())
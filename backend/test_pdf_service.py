@@ -0,0 +1,296 @@
+import asyncio
+import io
+import shutil
+from concurrent.futures import Executor, Future
+from unittest.mock import MagicMock, AsyncMock
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+import sys
+import os
+
+# Add backend to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.pdf_service import PDFService, PDFDocument, _parse_page_sizes
+from services.gemini_service import GeminiService
+
+
+class StubExecutor(Executor):
+    # Records submitted renders and lets the test complete them by hand
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self.futures.append(future)
+        return future
+
+
+async def settle():
+    # Let wrapped executor futures and done callbacks propagate
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def render(executor, document, page_num, dpi=150):
+    # Render through the service, completing the job if one was submitted.
+    # Returns True when the render was submitted, False on a cache hit.
+    submitted = len(executor.futures)
+    task = asyncio.ensure_future(document.render(page_num, dpi=dpi))
+    await settle()
+    if len(executor.futures) > submitted:
+        executor.futures[-1].set_result(Image.new('RGB', (10, 10)))
+    await task
+    return len(executor.futures) > submitted
+
+
+def make_document(max_bytes=None):
+    executor = StubExecutor()
+    service = PDFService(executor=executor)
+    if max_bytes is not None:
+        service.CACHE_MAX_BYTES = max_bytes
+    return service, executor, PDFDocument(service, "doc", [(72, 72)] * 5)
+
+
+def test_page_size():
+    document = PDFDocument(None, "doc", [(612, 792), (2592, 1728), (100.2, 100.2)])
+    assert document.page_count == 3
+    assert document.page_size(1, 72) == (612, 792)
+    assert document.page_size(2, 300) == (10800, 7200)
+    # Fractional sizes round up, as pdftoppm does
+    assert document.page_size(3, 72) == (101, 101)
+
+
+def test_region_to_pixels():
+    document = PDFDocument(None, "doc", [(720, 360)])
+
+    # 3000x1500 pixels at 300 DPI
+    assert document.region_to_pixels(1, [0, 0, 500, 500], 300) == (0, 0, 1500, 750)
+    assert document.region_to_pixels(1, [500, 500, 1000, 1000], 300) == (1500, 750, 1500, 750)
+
+    # Tile regions built from pixel offsets map back to the same pixels
+    region = [1200 / 1500 * 1000, 1200 / 3000 * 1000, 1500 / 1500 * 1000, 2700 / 3000 * 1000]
+    assert document.region_to_pixels(1, [round(v, 3) for v in region], 300) == (1200, 1200, 1500, 300)
+
+
+def test_parse_page_sizes():
+    output = """Pages:          2
+Page    1 size: 612 x 792 pts (letter)
+Page    1 rot:  0
+Page    1 MediaBox:     0.00     0.00   612.00   792.00
+Page    1 CropBox:      0.00     0.00   612.00   792.00
+Page    2 size: 2592 x 1728 pts
+Page    2 rot:  90
+Page    2 MediaBox:     0.00     0.00  2592.00  1728.00
+"""
+    # Rotated pages report their size as displayed
+    assert _parse_page_sizes(output) == [(612, 792), (1728, 2592)]
+
+
+async def _test_render_cache_hit():
+    service, executor, document = make_document()
+
+    # Concurrent requests for the same render share one job
+    first = asyncio.ensure_future(document.render(1, [0, 0, 500, 500], 300))
+    second = asyncio.ensure_future(document.render(1, [0, 0, 500, 500], 300))
+    await settle()
+    assert len(executor.futures) == 1
+
+    image = Image.new('RGB', (10, 10), color='white')
+    executor.futures[0].set_result(image)
+    assert await first is image
+    assert await second is image
+
+    # Later requests are served from the cache
+    assert await document.render(1, [0, 0, 500, 500], 300) is image
+    assert len(executor.futures) == 1
+
+    # A different DPI is a different render
+    assert await render(executor, document, 1, dpi=100)
+
+    service.shutdown()
+
+
+async def _test_render_failure():
+    service, executor, document = make_document()
+
+    task = asyncio.ensure_future(document.render(1, dpi=150))
+    await settle()
+    executor.futures[0].set_exception(RuntimeError("pdftoppm failed"))
+    try:
+        await task
+        assert False, "render should have failed"
+    except RuntimeError:
+        pass
+
+    # The failure is not cached, so the next request renders again
+    assert await render(executor, document, 1)
+
+    service.shutdown()
+
+
+async def _test_render_failure_with_cancelled_awaiter():
+    service, executor, document = make_document()
+
+    task = asyncio.ensure_future(document.render(1, dpi=150))
+    await settle()
+    task.cancel()
+    await settle()
+
+    # The render keeps running after its only awaiter is gone
+    executor.futures[0].set_exception(RuntimeError("pdftoppm failed"))
+    await settle()
+
+    assert await render(executor, document, 1)
+
+    service.shutdown()
+
+
+async def _test_render_success_with_cancelled_awaiter():
+    # Room for one 10x10 RGB render
+    service, executor, document = make_document(max_bytes=300)
+
+    task = asyncio.ensure_future(document.render(1, dpi=150))
+    await settle()
+    task.cancel()
+    await settle()
+    executor.futures[0].set_result(Image.new('RGB', (10, 10)))
+    await settle()
+
+    # The finished render is cached...
+    assert not await render(executor, document, 1)
+    # ...and counts towards the byte budget, so it can be evicted
+    assert await render(executor, document, 2)
+    assert await render(executor, document, 1)
+
+    service.shutdown()
+
+
+async def _test_render_cache_eviction():
+    # Room for two 10x10 RGB renders
+    service, executor, document = make_document(max_bytes=600)
+
+    for page_num in (1, 2, 3):
+        assert await render(executor, document, page_num)
+
+    # Oldest render is evicted to stay within the byte budget
+    assert not await render(executor, document, 3)
+    assert not await render(executor, document, 2)
+    assert await render(executor, document, 1)
+
+    # Page 1 pushed out page 3, the least recently used
+    assert not await render(executor, document, 2)
+    assert await render(executor, document, 3)
+
+    service.shutdown()
+
+
+async def _test_render_rotated_region():
+    # 200x100pt page with a 20x20pt mark in its top-left corner
+    source = Image.new('RGB', (200, 100), color='white')
+    source.paste((0, 0, 0), (0, 0, 20, 20))
+    buffered = io.BytesIO()
+    source.save(buffered, format="PDF", resolution=72)
+
+    # Rotated 90 clockwise, the mark is in the top-right corner as displayed
+    writer = PdfWriter()
+    page = writer.add_page(PdfReader(io.BytesIO(buffered.getvalue())).pages[0])
+    page.rotate(90)
+    buffered = io.BytesIO()
+    writer.write(buffered)
+
+    service = PDFService(max_workers=1)
+    try:
+        document = await service.open_document(buffered.getvalue())
+        assert document.page_size(1, 72) == (100, 200)
+
+        full_page = await document.render(1, dpi=72)
+        assert full_page.size == document.page_size(1, 72)
+
+        # Top-right quarter of the displayed page
+        tile = await document.render(1, [0, 500, 500, 1000], dpi=72)
+        assert tile.size == (50, 100)
+        assert tile.convert('L').getpixel((40, 10)) < 64
+        assert tile.convert('L').getpixel((10, 10)) > 192
+        assert tile.convert('L').getpixel((40, 60)) > 192
+    finally:
+        service.shutdown()
+
+
+class TilingStubDocument:
+    # 3000x3000px page at 300 DPI whose overview is drawn by the test
+    def __init__(self):
+        self.rendered = []
+
+    def page_size(self, page_num, dpi):
+        return 3000 * dpi // 300, 3000 * dpi // 300
+
+    async def render(self, page_num, region=None, dpi=None):
+        self.rendered.append(region)
+        return Image.new('RGB', (1500, 1500), color='white')
+
+
+async def _test_tiling_skips_blank_tiles():
+    service = GeminiService()
+    service.model = MagicMock()
+    service.model.generate_content_async = AsyncMock()
+    service.model.generate_content_async.return_value.text = "[]"
+
+    # 150 DPI overview with a single mark in the top-left corner
+    overview = Image.new('RGB', (1500, 1500), color='white')
+    overview.putpixel((100, 100), (0, 0, 0))
+
+    document = TilingStubDocument()
+    await service.process_with_tiling(overview, "Test Equipment", 1, None, None, None, document)
+
+    # 3x3 grid at 300 DPI; only the top-left tile covers the mark
+    assert document.rendered == [[0.0, 0.0, 500.0, 500.0]]
+    assert service.model.generate_content_async.await_count == 1
+
+
+def test_render_cache_hit():
+    asyncio.run(_test_render_cache_hit())
+
+
+def test_render_failure():
+    asyncio.run(_test_render_failure())
+
+
+def test_render_failure_with_cancelled_awaiter():
+    asyncio.run(_test_render_failure_with_cancelled_awaiter())
+
+
+def test_render_success_with_cancelled_awaiter():
+    asyncio.run(_test_render_success_with_cancelled_awaiter())
+
+
+def test_render_cache_eviction():
+    asyncio.run(_test_render_cache_eviction())
+
+
+def test_render_rotated_region():
+    if not shutil.which("pdftoppm"):
+        import pytest
+        pytest.skip("poppler is not installed")
+    asyncio.run(_test_render_rotated_region())
+
+
+def test_tiling_skips_blank_tiles():
+    asyncio.run(_test_tiling_skips_blank_tiles())
+
+
+if __name__ == "__main__":
+    test_page_size()
+    test_region_to_pixels()
+    test_parse_page_sizes()
+    test_render_cache_hit()
+    test_render_failure()
+    test_render_failure_with_cancelled_awaiter()
+    test_render_success_with_cancelled_awaiter()
+    test_render_cache_eviction()
+    if shutil.which("pdftoppm"):
+        test_render_rotated_region()
+    else:
+        print("Skipping rendering check: poppler is not installed")
+    test_tiling_skips_blank_tiles()
+    print("All PDF service checks passed")